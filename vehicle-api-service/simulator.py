@@ -0,0 +1,223 @@
+import threading
+import time
+import random
+import logging
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from state_store import (
+    MIN_BATTERY_THRESHOLD,
+    HIGH_RPM_THRESHOLD,
+    MIN_TEMPERATURE,
+    SPEED_TABLE,
+    CONTROL_FIELDS,
+    DEFAULT_VEHICLE_STATE,
+    vehicle_state,
+    state_lock,
+    create_current_state_document,
+    enqueue_update,
+    start_background_threads
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MIN_TICK_INTERVAL = 1.0  # Seconds between ticks while state is changing
+MAX_TICK_INTERVAL = 5.0  # Longest idle wait between ticks
+PARKING_BRAKE_TOGGLE_RATE = 0.001  # Expected toggles per second
+CHECK_ENGINE_TOGGLE_RATE = 0.0005  # Expected toggles per second
+
+# Set when the API changes the state, to wake the simulation loop early
+wake_event = threading.Event()
+
+# Firestore flush bookkeeping; the simulator only ever writes fields outside CONTROL_FIELDS
+FLUSH_INTERVAL = 30  # Seconds between forced flushes
+_last_flushed_state = {}
+_last_flush_ts = 0
+
+def _state_is_dirty(state):
+    """Check whether state changed meaningfully since the last Firestore flush"""
+    if not _last_flushed_state:
+        return True
+    
+    # Numeric fields only count as changed once they move by at least 1 unit
+    for key in ('battery_percentage', 'battery_temperature'):
+        if key not in _last_flushed_state or abs(state[key] - _last_flushed_state[key]) >= 1:
+            return True
+    
+    # Any other field change (indicators, settings) is significant; skip last_update
+    for key, value in state.items():
+        if key in ('battery_percentage', 'battery_temperature', 'last_update'):
+            continue
+        if _last_flushed_state.get(key) != value:
+            return True
+    
+    return False
+
+def flush_vehicle_state(state, current_time, force=False):
+    """Queue the fields that changed since the last flush; a forced flush rewrites them all"""
+    global _last_flushed_state, _last_flush_ts
+    if force:
+        fields = state
+    else:
+        fields = {k: v for k, v in state.items() if _last_flushed_state.get(k) != v}
+    enqueue_update(fields)
+    _last_flushed_state = state
+    _last_flush_ts = current_time
+
+def _simulated_fields(state):
+    """Return the fields of the state that the simulator owns"""
+    return {k: v for k, v in state.items() if k not in CONTROL_FIELDS and k != 'reset_id'}
+
+def apply_remote_state(data):
+    """Take the API-owned fields from a Firestore snapshot, or the whole document after a reset"""
+    global _last_flushed_state
+    with state_lock:
+        # Diff the next flush against what the document holds, not what this process last sent,
+        # so a stale write that lands after a reset is overwritten on the next tick
+        _last_flushed_state = _simulated_fields(data)
+        
+        if data.get('reset_id') != vehicle_state.get('reset_id'):
+            # The API replaced the document. Simulated fields restart from the defaults, since
+            # anything this process flushed after the reset was computed from pre-reset state
+            vehicle_state.clear()
+            vehicle_state.update(data)
+            vehicle_state.update(_simulated_fields(DEFAULT_VEHICLE_STATE))
+            wake_event.set()
+            return
+        
+        controls = {k: data[k] for k in CONTROL_FIELDS if k in data}
+        if any(vehicle_state.get(k) != v for k, v in controls.items()):
+            vehicle_state.update(controls)
+            wake_event.set()
+        elif _state_is_dirty(_simulated_fields(vehicle_state)):
+            wake_event.set()
+
+def update_vehicle_state():
+    """Simulation loop for realistic battery, temperature, and indicator behavior"""
+    logger.info("Starting vehicle state update loop")
+    current_backoff = MIN_TICK_INTERVAL
+    last_tick_time = time.time()
+    
+    # Schedule random indicator toggles as Poisson processes instead of polling the RNG each tick
+    next_brake_toggle = time.time() + random.expovariate(PARKING_BRAKE_TOGGLE_RATE)
+    next_check_engine_toggle = time.time() + random.expovariate(CHECK_ENGINE_TOGGLE_RATE)
+    
+    while True:
+        try:
+            current_time = time.time()
+            
+            # Rates are per second; scale them by the real time since the last tick,
+            # since wake-ups and idle backoff make tick spacing irregular
+            elapsed = current_time - last_tick_time
+            last_tick_time = current_time
+            
+            with state_lock:
+                previous_state = dict(vehicle_state)
+                
+                if not vehicle_state['is_charging'] and vehicle_state['motor_speed_setting'] > 0:
+                    setting = SPEED_TABLE[vehicle_state['motor_speed_setting']]
+                    
+                    # Power consumption based on current state
+                    power_consumption = setting.base_power * max(0.5, vehicle_state['battery_percentage'] / 100)
+                    consumption_rate = power_consumption * 0.001 * elapsed  # Consumption rate per second
+                    
+                    # Update battery percentage
+                    vehicle_state['battery_percentage'] = max(
+                        0,
+                        vehicle_state['battery_percentage'] - consumption_rate
+                    )
+                    
+                    # Temperature simulation
+                    if vehicle_state['battery_temperature'] < setting.target_temp:
+                        vehicle_state['battery_temperature'] = min(
+                            setting.target_temp,
+                            vehicle_state['battery_temperature'] + 0.1 * elapsed
+                        )
+                
+                elif vehicle_state['is_charging']:
+                    # Charging simulation
+                    charge_rate = 0.2  # 0.2% per second
+                    if vehicle_state['battery_percentage'] < 20:
+                        charge_rate = 0.4  # Faster charging when battery is low
+                    
+                    vehicle_state['battery_percentage'] = min(
+                        100,
+                        vehicle_state['battery_percentage'] + charge_rate * elapsed
+                    )
+                    
+                    # Temperature decreases during charging
+                    vehicle_state['battery_temperature'] = max(
+                        MIN_TEMPERATURE,
+                        vehicle_state['battery_temperature'] - 0.05 * elapsed
+                    )
+                
+                # Update indicator states
+                vehicle_state['battery_low'] = vehicle_state['battery_percentage'] < MIN_BATTERY_THRESHOLD
+                vehicle_state['motor_status'] = vehicle_state['motor_rpm'] > HIGH_RPM_THRESHOLD
+                
+                # Random state changes for parking brake and check engine
+                if current_time >= next_brake_toggle:
+                    vehicle_state['parking_brake'] = not vehicle_state['parking_brake']
+                    next_brake_toggle = current_time + random.expovariate(PARKING_BRAKE_TOGGLE_RATE)
+                    logger.info(f"Parking brake state changed to: {vehicle_state['parking_brake']}")
+                
+                if current_time >= next_check_engine_toggle:
+                    vehicle_state['check_engine'] = not vehicle_state['check_engine']
+                    next_check_engine_toggle = current_time + random.expovariate(CHECK_ENGINE_TOGGLE_RATE)
+                    logger.info(f"Check engine state changed to: {vehicle_state['check_engine']}")
+                
+                vehicle_state['last_update'] = int(time.time() * 1000)
+                snapshot = dict(vehicle_state)
+                simulated = _simulated_fields(snapshot)
+                
+                # Update Firestore only on meaningful change or when the flush interval elapses
+                if _state_is_dirty(simulated):
+                    flush_vehicle_state(simulated, current_time)
+                elif (current_time - _last_flush_ts) >= FLUSH_INTERVAL:
+                    flush_vehicle_state(simulated, current_time, force=True)
+            
+            # Back off while nothing is changing; API writes wake the loop via the listener
+            changed = any(
+                snapshot[key] != previous_state.get(key)
+                for key in snapshot if key != 'last_update'
+            )
+            if changed:
+                current_backoff = MIN_TICK_INTERVAL
+            else:
+                current_backoff = min(MAX_TICK_INTERVAL, current_backoff * 2)
+            
+            # Never sleep past the next scheduled indicator toggle
+            next_event = min(next_brake_toggle, next_check_engine_toggle)
+            timeout = min(current_backoff, max(0, next_event - time.time()))
+            
+            if wake_event.wait(timeout=timeout):
+                wake_event.clear()
+                current_backoff = MIN_TICK_INTERVAL
+        
+        except Exception as e:
+            logger.error(f"Error in update loop: {e}")
+            time.sleep(1)
+
+class HealthHandler(BaseHTTPRequestHandler):
+    """Answer Cloud Run and App Engine startup and health checks for the headless simulator"""
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.end_headers()
+        self.wfile.write(b'ok')
+    
+    def log_message(self, format, *args):
+        pass
+
+def start_health_server():
+    """Serve health checks on $PORT so the platform treats the instance as started"""
+    server = ThreadingHTTPServer(('0.0.0.0', int(os.getenv('PORT', 8081))), HealthHandler)
+    health_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    health_thread.start()
+
+if __name__ == '__main__':
+    start_health_server()
+    create_current_state_document()
+    start_background_threads(apply_remote_state)
+    update_vehicle_state()
@@ -0,0 +1,230 @@
+import threading
+import queue
+import time
+from collections import namedtuple
+import logging
+import os
+from google.api_core import exceptions, retry
+from google.cloud import firestore
+from google.cloud.exceptions import NotFound
+from google.cloud.firestore_v1.services.firestore import client as firestore_client
+from google.cloud.firestore_v1.services.firestore.transports.grpc import FirestoreGrpcTransport
+
+logger = logging.getLogger(__name__)
+
+# Realistic constants definition
+MIN_BATTERY_THRESHOLD = 20
+HIGH_RPM_THRESHOLD = 3000
+MAX_TEMPERATURE = 80
+MIN_TEMPERATURE = 25
+
+# Motor parameters for one speed setting; SPEED_TABLE is indexed by speed setting
+SpeedSetting = namedtuple('SpeedSetting', ['motor_rpm', 'gear_ratio', 'base_power', 'target_temp'])
+
+SPEED_TABLE = tuple(
+    SpeedSetting(rpm, gear_ratio, base_power, MIN_TEMPERATURE + (MAX_TEMPERATURE - MIN_TEMPERATURE) * i / 4)
+    for i, (rpm, gear_ratio, base_power) in enumerate((
+        (0, "N/N", 0),
+        (1500, "4.5:1", 100),     # 100 kW
+        (3000, "6.2:1", 300),     # 300 kW
+        (4500, "8.1:1", 600),     # 600 kW
+        (6000, "10.3:1", 1000)    # 1000 kW
+    ))
+)
+
+# Default vehicle state; last_update is stamped when the defaults are applied
+DEFAULT_VEHICLE_STATE = {
+    "parking_brake": False,
+    "check_engine": False,
+    "motor_status": False,
+    "battery_low": False,
+    "power": 0,
+    "motor_rpm": 0,
+    "gear_ratio": "N/N",
+    "battery_percentage": 100,
+    "battery_temperature": 25,
+    "motor_speed_setting": 0,
+    "is_charging": False,
+    "last_update": 0
+}
+
+# Fields owned by the API; the simulator owns every other field of the document
+CONTROL_FIELDS = ('motor_speed_setting', 'motor_rpm', 'gear_ratio', 'power', 'is_charging')
+
+# Initialize Firestore
+google_credentials_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
+if google_credentials_path:
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = google_credentials_path
+
+# Keep idle gRPC streams alive between writes so they are not reaped by proxies.
+# google-cloud-firestore 2.3.4 already sets keepalive_time_ms=30000; these options replace
+# the library's, so it is repeated here. The timeout and ping limit are the additions.
+GRPC_KEEPALIVE_OPTIONS = [
+    ('grpc.keepalive_time_ms', 30000),
+    ('grpc.keepalive_timeout_ms', 10000),
+    ('grpc.http2.max_pings_without_data', 0)
+]
+
+# Private attributes of BaseClient that _firestore_api below relies on
+_REQUIRED_CLIENT_ATTRS = (
+    '_firestore_api_internal', '_emulator_host', '_target', '_credentials',
+    '_client_options', '_client_info'
+)
+
+class KeepaliveFirestoreClient(firestore.Client):
+    """Firestore client whose gRPC channel uses explicit keepalive settings.
+
+    Mirrors BaseClient._firestore_api_helper from google-cloud-firestore 2.3.4 with different
+    channel options. The constructor fails loudly if an upgrade removes what it relies on.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        missing = [name for name in _REQUIRED_CLIENT_ATTRS if not hasattr(self, name)]
+        if not hasattr(firestore_client, '_client_info'):
+            missing.append('firestore_client._client_info')
+        if missing:
+            raise RuntimeError(
+                "google-cloud-firestore internals changed, KeepaliveFirestoreClient "
+                f"needs updating (missing: {', '.join(missing)})"
+            )
+    
+    @property
+    def _firestore_api(self):
+        if self._firestore_api_internal is None and self._emulator_host is None:
+            channel = FirestoreGrpcTransport.create_channel(
+                self._target,
+                credentials=self._credentials,
+                options=GRPC_KEEPALIVE_OPTIONS
+            )
+            self._transport = FirestoreGrpcTransport(host=self._target, channel=channel)
+            self._firestore_api_internal = firestore_client.FirestoreClient(
+                transport=self._transport, client_options=self._client_options
+            )
+            firestore_client._client_info = self._client_info
+        return super()._firestore_api
+
+# Initialize Firestore; one client per process shares a single channel across threads
+db = KeepaliveFirestoreClient(project='ev-dashboard-system-2024')
+CURRENT_STATE_DOC = db.collection('vehiclestate').document('current_state')
+
+# Exponential backoff with jitter for transient Firestore errors
+_retry = retry.Retry(
+    initial=0.1,
+    maximum=2.0,
+    multiplier=2.0,
+    deadline=10.0,
+    predicate=retry.if_exception_type(
+        exceptions.ServiceUnavailable,
+        exceptions.DeadlineExceeded,
+        exceptions.InternalServerError
+    )
+)
+
+def create_current_state_document():
+    try:
+        doc = CURRENT_STATE_DOC.get(retry=_retry)
+        if not doc.exists:
+            initial_state = dict(DEFAULT_VEHICLE_STATE, last_update=int(time.time() * 1000))
+            CURRENT_STATE_DOC.set(initial_state, retry=_retry)
+            logger.info("Created initial current_state document in Firestore")
+        else:
+            logger.info("current_state document already exists in Firestore")
+    except NotFound:
+        # If the database doesn't exist, create a new one
+        logger.info("Firestore database not found, creating a new one...")
+        db.create_database("vehicle-monitoring")
+        initial_state = dict(DEFAULT_VEHICLE_STATE, last_update=int(time.time() * 1000))
+        CURRENT_STATE_DOC.set(initial_state, retry=_retry)
+        logger.info("New Firestore database created and initial document set")
+
+# Pending Firestore writes as (op, fields) pairs, applied in order by the writer thread
+_write_q = queue.Queue()
+
+def enqueue_update(fields):
+    """Queue a write of just the given fields"""
+    _write_q.put(('update', fields))
+
+def enqueue_set(state):
+    """Queue a full replacement of the document"""
+    _write_q.put(('set', state))
+
+def write_vehicle_state():
+    """Background thread that writes queued state changes to Firestore"""
+    logger.info("Starting Firestore writer thread")
+    
+    while True:
+        op, fields = _write_q.get()
+        fields = dict(fields)
+        
+        # Collapse the backlog into one write: later fields win, and a set replaces everything queued before it
+        while True:
+            try:
+                next_op, next_fields = _write_q.get_nowait()
+            except queue.Empty:
+                break
+            if next_op == 'set':
+                op, fields = 'set', dict(next_fields)
+            else:
+                fields.update(next_fields)
+        
+        try:
+            if op == 'set':
+                CURRENT_STATE_DOC.set(fields, retry=_retry)
+            else:
+                # Merge only these fields; unlike update() this also creates a missing document
+                CURRENT_STATE_DOC.set(fields, merge=True, retry=_retry)
+        except Exception as e:
+            logger.error(f"Error in writer thread: {e}")
+
+def calculate_power_consumption(speed_setting, battery_percentage):
+    """Calculate power consumption based on speed setting and battery level"""
+    if battery_percentage <= 0:
+        return 0
+    
+    base_power = SPEED_TABLE[speed_setting].base_power
+    battery_factor = max(0.5, battery_percentage / 100)  # Battery efficiency drops when low
+    return base_power * battery_factor
+
+# Initialize vehicle state
+vehicle_state = dict(DEFAULT_VEHICLE_STATE, last_update=int(time.time() * 1000))
+
+# State lock shared by background threads and request handlers
+state_lock = threading.RLock()
+
+def load_vehicle_state():
+    """Seed the in-process vehicle state from the persisted Firestore document"""
+    try:
+        doc = CURRENT_STATE_DOC.get(retry=_retry)
+        if doc.exists:
+            with state_lock:
+                vehicle_state.update(doc.to_dict())
+            logger.info("Loaded vehicle state from Firestore")
+    except Exception as e:
+        logger.error(f"Error loading vehicle state: {e}")
+
+def apply_document(data):
+    """Mirror the whole Firestore document into the in-process copy"""
+    with state_lock:
+        vehicle_state.update(data)
+
+_threads_started = False
+
+def start_background_threads(apply_snapshot=apply_document):
+    """Start the writer thread and the Firestore listener once per process"""
+    global _threads_started
+    with state_lock:
+        if _threads_started:
+            return
+        _threads_started = True
+    
+    # apply_snapshot decides which fields of each new document snapshot this process takes
+    def on_snapshot(doc_snapshots, changes, read_time):
+        for doc in doc_snapshots:
+            data = doc.to_dict()
+            if data:
+                apply_snapshot(data)
+    
+    load_vehicle_state()
+    writer_thread = threading.Thread(target=write_vehicle_state, daemon=True)
+    writer_thread.start()
+    CURRENT_STATE_DOC.on_snapshot(on_snapshot)
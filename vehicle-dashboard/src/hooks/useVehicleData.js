@@ -1,4 +1,5 @@
 import { useState, useEffect } from 'react';
+import { db, doc, onSnapshot } from '../firebase';
 
 // Update this to use relative path
 const API_BASE_URL = 'https://vehicle-dashboard-179965013028.asia-east1.run.app/api/vehicle';
@@ -22,42 +23,41 @@ const useVehicleData = () => {
     isCharging: false
   });
 
-  const fetchVehicleState = async () => {
-    try {
-      const response = await fetch(`${API_BASE_URL}/state`);
-      const vehicleState = await response.json();
-      
-      // Transform backend data to match frontend structure
-      setData({
-        indicators: {
-          parkingBrake: vehicleState.parking_brake,
-          checkEngine: vehicleState.check_engine,
-          motorWarning: vehicleState.motor_status,
-          batteryLow: vehicleState.battery_low
-        },
-        power: vehicleState.power,
-        rpm: vehicleState.motor_rpm,
-        gearRatio: vehicleState.gear_ratio,
-        battery: {
-          percentage: vehicleState.battery_percentage,
-          temperature: vehicleState.battery_temperature
-        },
-        motorSpeed: vehicleState.motor_speed_setting,
-        isCharging: vehicleState.is_charging
-      });
-    } catch (error) {
-      console.error('Error fetching vehicle data:', error);
-    }
-  };
-
   useEffect(() => {
-    // Initial fetch
-    fetchVehicleState();
+    // Subscribe to realtime updates of the vehicle state document
+    const unsubscribe = onSnapshot(
+      doc(db, 'vehiclestate', 'current_state'),
+      (snapshot) => {
+        const vehicleState = snapshot.data();
+        if (!vehicleState) {
+          return;
+        }
 
-    // Set up polling interval
-    const interval = setInterval(fetchVehicleState, 1000);
+        // Transform backend data to match frontend structure
+        setData({
+          indicators: {
+            parkingBrake: vehicleState.parking_brake,
+            checkEngine: vehicleState.check_engine,
+            motorWarning: vehicleState.motor_status,
+            batteryLow: vehicleState.battery_low
+          },
+          power: vehicleState.power,
+          rpm: vehicleState.motor_rpm,
+          gearRatio: vehicleState.gear_ratio,
+          battery: {
+            percentage: vehicleState.battery_percentage,
+            temperature: vehicleState.battery_temperature
+          },
+          motorSpeed: vehicleState.motor_speed_setting,
+          isCharging: vehicleState.is_charging
+        });
+      },
+      (error) => {
+        console.error('Error listening to vehicle data:', error);
+      }
+    );
 
-    return () => clearInterval(interval);
+    return () => unsubscribe();
   }, []);
 
   const updateMotorSpeed = async (speed) => {
@@ -75,8 +75,6 @@ const useVehicleData = () => {
         console.error('Error updating motor speed:', error);
         return;
       }
-      
-      await fetchVehicleState();
     } catch (error) {
       console.error('Error updating motor speed:', error);
     }
@@ -97,8 +95,6 @@ const useVehicleData = () => {
         console.error('Error toggling charging:', error);
         return;
       }
-
-      await fetchVehicleState();
     } catch (error) {
       console.error('Error toggling charging:', error);
     }
@@ -109,7 +105,6 @@ const useVehicleData = () => {
       await fetch(`${API_BASE_URL}/reset`, {
         method: 'POST',
       });
-      await fetchVehicleState();
     } catch (error) {
       console.error('Error resetting vehicle:', error);
     }